@@ -1,9 +1,66 @@
 import argparse
 import json
 import sys
+import typing as t
 
 from . import jsp
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import simdjson
+except ImportError:  # pragma: no cover
+    simdjson = None  # type: ignore[assignment]
+
+
+def _pointer_keys(steps: t.Tuple[jsp.Step, ...]) -> t.Optional[t.Tuple[str, ...]]:
+    keys: t.List[str] = []
+    for op, arg in steps:
+        if op == "key" and arg != "*":
+            keys.append(t.cast(str, arg))
+        elif op == "keys":
+            keys.extend(t.cast(t.Tuple[str, ...], arg))
+        else:
+            return None
+    # A digit (or '-') token indexes arrays in a JSON Pointer, while the
+    # executor treats keys as dict-only; skip the fast path so results
+    # don't depend on whether pysimdjson is installed.
+    if any(key == "-" or key.isdigit() for key in keys):
+        return None
+    return tuple(keys)
+
+
+def _run_query(raw: bytes, path: str) -> t.Tuple[bool, t.Union[t.List[jsp.Json], str]]:
+    try:
+        steps = jsp.parse(path)
+    except jsp.ParseError as e:
+        return False, str(e)
+    keys = _pointer_keys(steps) if simdjson is not None else None
+    if keys:
+        # All-key paths map to a JSON Pointer, which pysimdjson can answer
+        # without materializing untouched subtrees into Python objects.
+        pointer = "".join("/" + key.replace("~", "~0").replace("/", "~1") for key in keys)
+        # Malformed documents must propagate like on the json/orjson path below;
+        # only a pointer miss means "no match".
+        doc = simdjson.Parser().parse(raw)
+        if not isinstance(doc, (simdjson.Object, simdjson.Array)):
+            # scalar root: a non-empty key path can never match
+            return True, []
+        try:
+            value = doc.at_pointer(pointer)
+        except (KeyError, IndexError, TypeError):
+            return True, []
+        if isinstance(value, simdjson.Object):
+            value = value.as_dict()
+        elif isinstance(value, simdjson.Array):
+            value = value.as_list()
+        return True, [value]
+    data: jsp.Json = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return jsp.try_query(data, path)
+
 
 def main() -> int:
     parser = argparse.ArgumentParser(
@@ -14,16 +71,18 @@ def main() -> int:
     args = parser.parse_args()
     path = args.JSONPath
 
-    data = sys.stdin.read()
-    data = json.loads(data)
+    raw = sys.stdin.buffer.read()
 
-    try:
-        result = jsp.query(data, path)
-    except jsp.ParseError as e:
-        print("ERROR:", e)
+    ok, result = _run_query(raw, path)
+    if not ok:
+        print("ERROR:", result)
         return 1
 
-    print(json.dumps(result))
+    if orjson is not None:
+        sys.stdout.buffer.write(orjson.dumps(result))
+        sys.stdout.buffer.write(b"\n")
+    else:
+        print(json.dumps(result))
     return 0
 
 
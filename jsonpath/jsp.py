@@ -1,13 +1,27 @@
+import functools
+import re
 import sys
 import typing as t
-from dataclasses import dataclass, field
 
-__all__ = ("query", "parse", "Json", "Error", "ParseError")
+__all__ = (
+    "query",
+    "try_query",
+    "iter_query",
+    "parse",
+    "precompute_descent_index",
+    "Query",
+    "Json",
+    "Error",
+    "ParseError",
+)
 
 
 Json = t.Union[None, int, float, t.Dict[str, "Json"], t.List["Json"]]
-Key = t.Union[t.Literal["*"], str]
 Slice = slice
+Step = t.Tuple[str, t.Union[str, Slice, t.Tuple[str, ...]]]
+StepFn = t.Callable[[t.Iterable[Json]], t.Iterator[Json]]
+
+_MISSING: t.Any = object()
 
 
 class Error(Exception):
@@ -18,213 +32,328 @@ class ParseError(Error):
     ...
 
 
-def _apply_star(results: t.Sequence[Json]) -> t.List[Json]:
-    new_results: t.List[Json] = []
+def _apply_star_iter(results: t.Iterable[Json]) -> t.Iterator[Json]:
+    return (
+        value
+        for result in results
+        for value in (
+            result.values() if type(result) is dict else result if type(result) is list else ()
+        )
+    )
+
+
+def _apply_key_iter(results: t.Iterable[Json], key: str) -> t.Iterator[Json]:
     for result in results:
-        if isinstance(result, dict):
-            new_results.extend(result.values())
-        if isinstance(result, list):
-            new_results.extend(result)
-    return new_results
+        if type(result) is dict:
+            value = result.get(key, _MISSING)
+            if value is not _MISSING:
+                yield value
 
 
-def _apply_key(results: t.Sequence[Json], key: Key) -> t.List[Json]:
-    if isinstance(key, str):
-        if key == "*":
-            return _apply_star(results)
-        else:
-            return [result[key] for result in results if isinstance(result, dict) and key in result]
+def _apply_keys_iter(results: t.Iterable[Json], keys: t.Tuple[str, ...]) -> t.Iterator[Json]:
+    for result in results:
+        curr = result
+        for key in keys:
+            curr = curr.get(key, _MISSING) if type(curr) is dict else _MISSING
+            if curr is _MISSING:
+                break
+        if curr is not _MISSING:
+            yield curr
 
 
-def _apply_slice(results: t.Sequence[Json], slice: Slice) -> t.List[Json]:
-    return [value for result in results if isinstance(result, list) for value in result[slice]]
+def _apply_slice_iter(results: t.Iterable[Json], slice: Slice) -> t.Iterator[Json]:
+    for result in results:
+        if type(result) is list:
+            yield from result[slice]
 
 
-def _recursive_descent_key(results: t.Sequence[Json], key: t.Union[Key, Slice]) -> t.List[Json]:
-    new_results: t.List[Json] = []
-    todo: t.List[Json] = [*(results[::-1])]
-    while len(todo) > 0:
+def _rd_star_iter(results: t.Iterable[Json]) -> t.Iterator[Json]:
+    # LIFO stack with reversed pushes keeps matches in document order (DFS preorder).
+    todo = list(results)
+    todo.reverse()
+    while todo:
         curr = todo.pop()
-        if key == "*":
-            new_values = _apply_star([curr])
-            new_results.extend(new_values)
-            todo.extend(new_values[::-1])
-        elif isinstance(curr, dict):
-            if isinstance(key, str) and key in curr:
-                new_results.append(curr[key])
-            values = list(curr.values())[::-1]
-            todo.extend(values)
-        elif isinstance(curr, list):
-            if isinstance(key, Slice):
-                new_results.extend(curr[key])
-            todo.extend(curr[::-1])
-    return new_results
-
-
-@dataclass
-class JsonPathQueryRunner:
-    data: Json
-    path: str
-    idx: int = field(default=0, init=False)
-    _curr: t.Optional[str] = field(default=None, init=False)
-    results: t.List[Json] = field(default_factory=list, init=False)
-
-    def __post_init__(self) -> None:
-        if not self.at_end():
-            self._curr = self.path[0]
-
-    def query(self) -> t.List[Json]:
-        self.results = [self.data]
-        self.consume("$", "at the beginning of JSONPath")
-        self.child()
-        return self.results
-
-    def child(self) -> None:
-        if self.at_end():
-            return
-        if self.match("."):
-            if self.match("."):
-                self.recursive_descent()
-            else:
-                key = self.key()
-                if isinstance(key, str):
-                    self.results = _apply_key(self.results, key)
+        if type(curr) is dict:
+            yield from curr.values()
+            todo.extend(reversed(curr.values()))
+        elif type(curr) is list:
+            yield from curr
+            todo.extend(reversed(curr))
+
+
+def _rd_key_iter(results: t.Iterable[Json], key: str) -> t.Iterator[Json]:
+    todo = list(results)
+    todo.reverse()
+    while todo:
+        curr = todo.pop()
+        if type(curr) is dict:
+            value = curr.get(key, _MISSING)
+            if value is not _MISSING:
+                yield value
+            todo.extend(reversed(curr.values()))
+        elif type(curr) is list:
+            todo.extend(reversed(curr))
+
+
+def _rd_slice_iter(results: t.Iterable[Json], slice: Slice) -> t.Iterator[Json]:
+    todo = list(results)
+    todo.reverse()
+    while todo:
+        curr = todo.pop()
+        if type(curr) is dict:
+            todo.extend(reversed(curr.values()))
+        elif type(curr) is list:
+            yield from curr[slice]
+            todo.extend(reversed(curr))
+
+
+_NUM_RE = re.compile(r"-?[0-9]+")
+_KEY_RE = re.compile(r"[^.\[]*")
+
+
+def _num(s: str, i: int) -> t.Tuple[t.Optional[int], int]:
+    m = _NUM_RE.match(s, i)
+    if m is None:
+        return None, i
+    return int(m.group()), m.end()
+
+
+def _slice(s: str, i: int) -> t.Tuple[t.Optional[Slice], int]:
+    n = len(s)
+    start, i = _num(s, i)
+    if i < n and s[i] == ":":
+        i += 1
+        end, i = _num(s, i)
+        if i < n and s[i] == ":":
+            i += 1
+            step, i = _num(s, i)
+            return slice(start, end, step), i
+        return slice(start, end, None), i
+    elif start is None:
+        return None, i
+    elif start == -1:
+        return slice(start, None, None), i
+    else:
+        return slice(start, start + 1, None), i
+
+
+def _key(s: str, i: int) -> t.Tuple[t.Union[str, Slice], int]:
+    n = len(s)
+    if i >= n:
+        raise ParseError("Expected key at the end of JSONPath.")
+    if s[i] in (".", "$", "["):
+        raise ParseError(f"Key name can't start with a '{s[i]}' (pos: {i + 2})")
+
+    sl, i = _slice(s, i)
+    if sl is not None:
+        return sl, i
+
+    m = _KEY_RE.match(s, i)
+    assert m is not None
+    key = m.group()
+    quote_at = min((p for p in (key.find("'"), key.find('"')) if p != -1), default=-1)
+    if quote_at != -1:
+        raise ParseError(f"Forbidden char in key value: '{key[quote_at]}'.")
+    return sys.intern(key), m.end()
+
+
+def _bracket(s: str, i: int) -> t.Tuple[t.Union[str, Slice], int]:
+    n = len(s)
+    if i < n and s[i] == "*":
+        i += 1
+        if i >= n or s[i] != "]":
+            raise ParseError(f"Expected ']' after '*' (pos {i}).")
+        return "*", i + 1
+    if i < n and s[i] in ("'", '"'):
+        quote_type = s[i]
+        i += 1
+        end = s.find(quote_type, i)
+        if end == -1:
+            raise ParseError(f"String started at pos {i} was not closed.")
+        key = sys.intern(s[i:end])
+        i = end + 1
+        if i >= n or s[i] != "]":
+            raise ParseError(f"Expected ']' after {quote_type} (pos {i}).")
+        return key, i + 1
+    result, i = _slice(s, i)
+    if result is None:
+        raise ParseError(f"Expected a subscript or a slice after '[' (pos {i}).")
+    if i >= n or s[i] != "]":
+        raise ParseError(f"Expected ']' after numerical subscript or slice (pos {i}).")
+    return result, i + 1
+
+
+def _child(s: str, i: int, steps: t.List[Step]) -> None:
+    n = len(s)
+    while i < n:
+        if s[i] == ".":
+            i += 1
+            if i < n and s[i] == ".":
+                i += 1
+                if i < n and s[i] == "[":
+                    key, i = _bracket(s, i + 1)
                 else:
-                    self.results = _apply_slice(self.results, key)
-        elif self.match("["):
-            key = self.bracket()
-            if isinstance(key, str):
-                self.results = _apply_key(self.results, key)
-            elif isinstance(key, slice):
-                self.results = _apply_slice(self.results, key)
-        else:
-            assert False, f"Expected '.' or '[' at pos: {self.idx + 1}, got: '{self._curr}'"
-        self.child()
-
-    def recursive_descent(self) -> None:
-        if self.match("["):
-            key = self.bracket()
+                    key, i = _key(s, i)
+                steps.append(("rd", key))
+                continue
+            key, i = _key(s, i)
+        elif s[i] == "[":
+            key, i = _bracket(s, i + 1)
         else:
-            key = self.key()
-        self.results = _recursive_descent_key(self.results, key)
-
-    def key(self) -> t.Union[str, Slice]:
-        if self.at_end():
-            raise ParseError("Expected key at the end of JSONPath.")
-        if any(self.match(c) for c in (".", "$", "[")):
-            raise ParseError(f"Key name can't start with a '{self.prev()}' (pos: {self.idx + 1})")
-
-        slice = self.slice()
-        if slice is not None:
-            return slice
-
-        k = []
-        while not self.at_end() and self.curr not in [".", "["]:
-            if self.curr in ["'", '"']:
-                raise ParseError(f"Forbidden char in key value: '{self.curr}'.")
-            k.append(self.curr)
-            self.advance()
-        return "".join(k)
-
-    def bracket(self) -> t.Union[str, Slice]:
-        if self.match("*"):
-            self.consume("]", "after '*'")
-            return "*"
+            raise ParseError(f"Expected '.' or '[' at pos: {i + 1}, got: '{s[i]}'")
+        if isinstance(key, str):
+            steps.append(("key", key))
         else:
-            if self.match("'"):
-                quote_type = "'"
-                expect_num = False
-            elif self.match('"'):
-                quote_type = '"'
-                expect_num = False
-            else:
-                quote_type = None
-                expect_num = True
-            if expect_num:
-                result = self.slice()
-                if result is None:
-                    raise ParseError(f"Expected a subscript or a slice after '[' (pos {self.idx}).")
-                self.consume("]", "after numerical subscript or slice")
-                return result
+            steps.append(("slice", key))
+
+
+def _fuse_keys(steps: t.Sequence[Step]) -> t.List[Step]:
+    fused: t.List[Step] = []
+    run: t.List[str] = []
+    for op, arg in steps:
+        if op == "key" and arg != "*":
+            run.append(t.cast(str, arg))
+            continue
+        if run:
+            fused.append(("keys", tuple(run)) if len(run) > 1 else ("key", run[0]))
+            run = []
+        fused.append((op, arg))
+    if run:
+        fused.append(("keys", tuple(run)) if len(run) > 1 else ("key", run[0]))
+    return fused
+
+
+class _Program(t.NamedTuple):
+    steps: t.Tuple[Step, ...]
+    fns: t.Tuple[StepFn, ...]
+    # set when the whole path is plain key lookups, e.g. $.a.b.c
+    keys: t.Optional[t.Tuple[str, ...]]
+
+
+def _bind(steps: t.Sequence[Step]) -> t.Tuple[StepFn, ...]:
+    fns: t.List[StepFn] = []
+    for op, arg in steps:
+        if op == "key":
+            if arg == "*":
+                fns.append(_apply_star_iter)
             else:
-                # TODO: refactor to get rid of this assertion
-                assert quote_type is not None
-                k = []
-                str_beg = self.idx
-                while not self.at_end() and self._curr != quote_type:
-                    k.append(self._curr)
-                    self.advance()
-                if self.at_end():
-                    raise ParseError(f"String started at pos {str_beg} was not closed.")
-                if not self.match(quote_type):
-                    assert False, "Internal error."
-                self.consume("]", f"after {quote_type}")
-                return "".join(k)
-
-    def slice(self) -> t.Optional[Slice]:
-        start = self.num()
-        if self.match(":"):
-            end = self.num()
-            if self.match(":"):
-                step = self.num()
-                return slice(start, end, step)
-            return slice(start, end, None)
-        elif start is None:
-            return None
+                fns.append(functools.partial(_apply_key_iter, key=t.cast(str, arg)))
+        elif op == "keys":
+            fns.append(functools.partial(_apply_keys_iter, keys=t.cast(t.Tuple[str, ...], arg)))
+        elif op == "slice":
+            fns.append(functools.partial(_apply_slice_iter, slice=t.cast(Slice, arg)))
+        elif arg == "*":
+            fns.append(_rd_star_iter)
+        elif isinstance(arg, str):
+            fns.append(functools.partial(_rd_key_iter, key=arg))
         else:
-            if start == -1:
-                return slice(start, None, None)
-            else:
-                return slice(start, start + 1, None)
-
-    def num(self) -> t.Optional[int]:
-        k = []
-        if self.match("-"):
-            k.append("-")
-        while not self.at_end() and self.curr.isnumeric():
-            k.append(self.curr)
-            self.advance()
-        if len(k) == 0:
-            return None
-        return int("".join(k))
-
-    def match(self, c: str) -> bool:
-        assert len(c) == 1
-        if self._curr == c:
-            self.advance()
-            return True
-        return False
-
-    @property
-    def curr(self) -> str:
-        assert self._curr is not None
-        return self._curr
-
-    def prev(self) -> str:
-        return self.path[self.idx - 1]
-
-    def advance(self) -> None:
-        assert not self.at_end()
-        self.idx += 1
-        if not self.at_end():
-            self._curr = self.path[self.idx]
+            fns.append(functools.partial(_rd_slice_iter, slice=t.cast(Slice, arg)))
+    return tuple(fns)
+
+
+def _simple_keys(steps: t.Sequence[Step]) -> t.Optional[t.Tuple[str, ...]]:
+    if not steps:
+        return ()
+    if len(steps) == 1:
+        op, arg = steps[0]
+        if op == "keys":
+            return t.cast(t.Tuple[str, ...], arg)
+        if op == "key" and arg != "*":
+            return (t.cast(str, arg),)
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(path: str) -> _Program:
+    if not path.startswith("$"):
+        raise ParseError("Expected '$' at the beginning of JSONPath (pos 0).")
+    steps: t.List[Step] = []
+    _child(path, 1, steps)
+    steps = _fuse_keys(steps)
+    return _Program(tuple(steps), _bind(steps), _simple_keys(steps))
+
+
+def _run(fns: t.Sequence[StepFn], data: Json) -> t.Iterator[Json]:
+    results: t.Iterable[Json] = (data,)
+    for fn in fns:
+        results = fn(results)
+    return iter(results)
+
+
+def _walk_keys(data: Json, keys: t.Tuple[str, ...]) -> t.List[Json]:
+    curr = data
+    for key in keys:
+        if type(curr) is dict and key in curr:
+            curr = curr[key]
         else:
-            self._curr = None
+            return []
+    return [curr]
 
-    def at_end(self) -> bool:
-        return self.idx >= len(self.path)
 
-    def consume(self, c: str, where: str) -> None:
-        if self.at_end() or not self.match(c):
-            raise ParseError(f"Expected '{c}' {where} (pos {self.idx}).")
+def query(data: Json, path: str) -> t.List[Json]:
+    # Containers in `data` must be plain dicts/lists (as produced by json.loads),
+    # not subclasses; the executor checks types with `type(x) is ...`.
+    program = _compile(path)
+    if program.keys is not None:
+        return _walk_keys(data, program.keys)
+    return list(_run(program.fns, data))
 
 
-def query(data: Json, path: str) -> t.List[Json]:
-    return JsonPathQueryRunner(data, path).query()
+def try_query(data: Json, path: str) -> t.Tuple[bool, t.Union[t.List[Json], str]]:
+    # Like query(), but reports bad paths as (False, message) instead of raising.
+    try:
+        results = query(data, path)
+    except ParseError as e:
+        return False, str(e)
+    return True, results
 
 
-def parse(path: str) -> None:
-    JsonPathQueryRunner({}, path).query()
+def iter_query(data: Json, path: str) -> t.Iterator[Json]:
+    program = _compile(path)
+    if program.keys is not None:
+        return iter(_walk_keys(data, program.keys))
+    return _run(program.fns, data)
+
+
+def parse(path: str) -> t.Tuple[Step, ...]:
+    return _compile(path).steps
+
+
+def precompute_descent_index(data: Json) -> t.Dict[str, t.List[Json]]:
+    # Same DFS preorder as _rd_key_iter, so indexed answers match the executor.
+    index: t.Dict[str, t.List[Json]] = {}
+    todo: t.List[Json] = [data]
+    while todo:
+        curr = todo.pop()
+        if type(curr) is dict:
+            for key, value in curr.items():
+                index.setdefault(key, []).append(value)
+            todo.extend(reversed(curr.values()))
+        elif type(curr) is list:
+            todo.extend(reversed(curr))
+    return index
+
+
+class Query:
+    # Amortizes repeated queries against one document: the first $..key query
+    # builds an index of every key in the tree, later ones answer from it.
+    __slots__ = ("data", "_descent_index")
+
+    def __init__(self, data: Json) -> None:
+        self.data = data
+        self._descent_index: t.Optional[t.Dict[str, t.List[Json]]] = None
+
+    def query(self, path: str) -> t.List[Json]:
+        program = _compile(path)
+        if len(program.steps) == 1 and program.steps[0][0] == "rd":
+            key = program.steps[0][1]
+            if isinstance(key, str) and key != "*":
+                if self._descent_index is None:
+                    self._descent_index = precompute_descent_index(self.data)
+                return list(self._descent_index.get(key, ()))
+        if program.keys is not None:
+            return _walk_keys(self.data, program.keys)
+        return list(_run(program.fns, self.data))
 
 
 def main() -> None:
@@ -0,0 +1,70 @@
+import json
+import typing as t
+
+import pytest
+
+from . import cli
+
+
+class _StubDocument:
+    def __init__(self, data: cli.jsp.Json) -> None:
+        self._data = data
+
+    def at_pointer(self, pointer: str) -> cli.jsp.Json:
+        curr = self._data
+        for token in pointer.split("/")[1:]:
+            token = token.replace("~1", "/").replace("~0", "~")
+            if isinstance(curr, dict):
+                curr = curr[token]
+            elif isinstance(curr, list):
+                curr = curr[int(token)]
+            else:
+                raise TypeError(f"Can't index {type(curr)} with '{token}'.")
+        return curr
+
+
+class _StubParser:
+    def parse(self, raw: bytes) -> "t.Union[_StubDocument, cli.jsp.Json]":
+        data = json.loads(raw)
+        if isinstance(data, (dict, list)):
+            return _StubDocument(data)
+        # like pysimdjson, scalar roots come back as bare primitives
+        return data
+
+
+class _StubSimdjson:
+    Parser = _StubParser
+    Object = _StubDocument
+    Array = _StubDocument
+
+
+@pytest.fixture()
+def stub_simdjson(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cli, "simdjson", _StubSimdjson)
+
+
+def test_pointer_fast_path(stub_simdjson: None) -> None:
+    assert cli._run_query(b'{"a": {"b": 7}}', "$.a.b") == (True, [7])
+    assert cli._run_query(b'{"a": {}}', "$.a.b") == (True, [])
+
+
+def test_pointer_fast_path_scalar_root(stub_simdjson: None) -> None:
+    # matches the executor, which returns no results for key paths on scalars
+    assert cli._run_query(b"5", "$.a") == (True, [])
+
+
+def test_pointer_fast_path_skips_array_index_keys(stub_simdjson: None) -> None:
+    # matches _walk_keys, which treats keys as dict-only
+    assert cli._run_query(b"[10, 20]", "$['0']") == (True, [])
+    assert cli._run_query(b'{"0": 10}', "$['0']") == (True, [10])
+
+
+def test_malformed_document_propagates(stub_simdjson: None) -> None:
+    with pytest.raises(ValueError):
+        cli._run_query(b"{", "$.a.b")
+
+
+def test_bad_path_reported(stub_simdjson: None) -> None:
+    ok, error = cli._run_query(b"{}", "a")
+    assert not ok
+    assert isinstance(error, str)
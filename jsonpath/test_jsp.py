@@ -41,6 +41,17 @@ from . import jsp
             "$..*",
             [{"a": 1}, [{"b": {"a": 2}}], 1, {"b": {"a": 2}}, {"a": 2}, 2],
         ),
+        # descent must stay in document order (depth first), not breadth first
+        (
+            {"x": {"p": {"a": 1}}, "y": {"a": 2}},
+            "$..a",
+            [1, 2],
+        ),
+        (
+            {"x": {"p": {"a": 1}}, "y": {"a": 2}},
+            "$..*",
+            [{"p": {"a": 1}}, {"a": 2}, {"a": 1}, 1, 2],
+        ),
     ),
 )
 def test_query(d: jsp.Json, p: str, e: jsp.Json) -> None:
@@ -68,8 +79,31 @@ def test_query(d: jsp.Json, p: str, e: jsp.Json) -> None:
         "$.['a\"]",
         # whitespace
         "$.[ 'a' ]",
+        # key without a leading '.' or '['
+        "$a",
     ),
 )
 def test_parse_errors(p: str) -> None:
     with pytest.raises(jsp.ParseError):
         jsp.parse(p)
+
+
+def test_try_query() -> None:
+    assert jsp.try_query({"a": 1}, "$.a") == (True, [1])
+    ok, error = jsp.try_query({"a": 1}, "a")
+    assert not ok
+    assert isinstance(error, str)
+
+
+def test_query_object_uses_descent_index() -> None:
+    d: jsp.Json = [{"a": 1}, {"b": {"a": 2}}, [{"c": {"d": {"a": 4}}, "a": 3}]]
+    q = jsp.Query(d)
+    assert q.query("$..a") == jsp.query(d, "$..a")
+    assert q.query("$..missing") == []
+    assert q.query("$.0.a") == [1]
+
+
+def test_iter_query() -> None:
+    it = jsp.iter_query({"a": [{"b": 1}, {"b": 2}]}, "$.a.*.b")
+    assert not isinstance(it, list)
+    assert list(it) == [1, 2]